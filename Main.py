@@ -14,27 +14,23 @@ workingDir = r'D:\AccountCleaner'
 os.chdir(workingDir)
 
 from funcs import *
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 logsPath = r'D:\Accounts'
+maxWorkers = os.cpu_count()
+blockSize = 64 << 20
+chunkSize = 10000
+enableBackup = True
 
-files = extractWantedFiles(logsPath)
-
-engine = createEngine()
-
-for file in files:    
-    fileType = detectFileType(file)
-    data = loadTextFiles(file, logsPath, fileType)
+if __name__ == '__main__':
+    files = extractWantedFiles(logsPath)
     
-    if data.shape[0] == 0: 
-        continue
+    engine = createEngine()
+    createTables(engine)
+    engine.dispose()
     
-    data = makeDataClean(data, fileType)
-    data = enrichData(data, file, fileType)
-    createPickle(data, fileType)
-
-    dbtypes = setDBTypes(fileType)
-    if fileType == "ValidationOk":
-        fixColumnSize(data, fileType).to_sql(name = 'ValidationOk', con = engine, schema = 'Account', if_exists='append', index = False, dtype = dbtypes)
-    elif fileType == "ValidationError":
-        fixColumnSize(data, fileType).to_sql(name = 'ValidationError', con = engine, schema = 'Account', if_exists='append', index = False, dtype = dbtypes)
-        
-moveLogs(logsPath, files)
\ No newline at end of file
+    with ProcessPoolExecutor(max_workers = maxWorkers, initializer = initWorker) as executor:
+        for _ in executor.map(processFile, files.keys(), files.values(), repeat(logsPath), repeat(blockSize), repeat(chunkSize), repeat(enableBackup)):
+            pass
+            
+    moveLogs(logsPath, files)
\ No newline at end of file
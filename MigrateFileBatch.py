@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+One-off migration of Account.ValidationOk and Account.ValidationError from
+per-row FileName/Type columns to FileBatchId. It drops the old columns, so
+run it by hand against a copy of the database before the live one.
+"""
+
+import os
+import sqlalchemy as sa
+
+workingDir = r'D:\AccountCleaner'
+os.chdir(workingDir)
+
+from funcs import createEngine, _METADATA, _TABLES
+
+def migrateToFileBatch(connection, tableName, schema = 'Account'):
+    table = f'[{schema}].[{tableName}]'
+    connection.exec_driver_sql(f'ALTER TABLE {table} ADD [FileBatchId] INT NULL')
+    connection.exec_driver_sql(f'INSERT INTO [{schema}].[FileBatch] ([FileName], [Type]) SELECT DISTINCT [FileName], [Type] FROM {table}')
+    connection.exec_driver_sql(f'UPDATE t SET [FileBatchId] = b.[FileBatchId] FROM {table} AS t '
+                               f'JOIN [{schema}].[FileBatch] AS b ON b.[FileName] = t.[FileName] AND b.[Type] = t.[Type] AND b.[ProcessedAt] IS NULL')
+    connection.exec_driver_sql(f'ALTER TABLE {table} DROP COLUMN [FileName], [Type]')
+
+if __name__ == '__main__':
+    engine = createEngine()
+    _METADATA.create_all(engine, checkfirst = True)
+    with engine.begin() as connection:
+        inspector = sa.inspect(connection)
+        for tableName, table in _TABLES.items():
+            if 'FileBatchId' not in {col['name'] for col in inspector.get_columns(tableName, schema = _METADATA.schema)}:
+                migrateToFileBatch(connection, tableName, _METADATA.schema)
+            if not inspector.get_foreign_keys(tableName, schema = _METADATA.schema):
+                for constraint in table.foreign_key_constraints:
+                    connection.execute(sa.schema.AddConstraint(constraint))
@@ -6,130 +6,225 @@ Created on Tue Jan 10 10:27:22 2023
 """
 import os
 import re
+import errno
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from datetime import datetime
+from pathlib import Path
 import shutil
 import sqlalchemy as sa
-import codecs
+from sqlalchemy.dialects import mssql
+from types import MappingProxyType
+
+_engine = None
+
+_FILE_RE = re.compile(r'(ValidationError|ValidationOk)\d*\.txt')
+
+_DB_TYPES = MappingProxyType({
+    "ValidationOk": MappingProxyType({"BankName":  sa.types.NVARCHAR(length=50), 
+                                      "AccountNumber": sa.types.VARCHAR(length=50), 
+                                      "ShebaNumber": sa.types.VARCHAR(length=50),
+                                      "NationalCode": sa.types.VARCHAR(length=30), 
+                                      "Date": sa.types.VARCHAR(length=10), 
+                                      "TransactionTime": sa.types.VARCHAR(length=21),  
+                                      "Status": sa.types.NVARCHAR(length=1000), 
+                                      "FileBatchId": sa.types.INTEGER()}),
+    "ValidationError": MappingProxyType({"BankName":  sa.types.NVARCHAR(length=100), 
+                                         "AccountNumber": sa.types.VARCHAR(length=50), 
+                                         "ShebaNumber": sa.types.VARCHAR(length=50),
+                                         "NationalCode": sa.types.VARCHAR(length=30), 
+                                         "Date": sa.types.VARCHAR(length=10), 
+                                         "TransactionTime": sa.types.VARCHAR(length=21), 
+                                         "ErrorCode": sa.types.VARCHAR(length=10), 
+                                         "Status": sa.types.NVARCHAR(length=1000), 
+                                         "FileBatchId": sa.types.INTEGER()})})
+
+_METADATA = sa.MetaData(schema = 'Account')
+
+_FILE_BATCH = sa.Table('FileBatch', _METADATA,
+                       sa.Column('FileBatchId', sa.types.INTEGER(), primary_key = True, autoincrement = True),
+                       sa.Column('FileName', sa.types.NVARCHAR(length=256)),
+                       sa.Column('Type', sa.types.VARCHAR(length=20)),
+                       sa.Column('ProcessedAt', mssql.DATETIME2(precision=0)))
+
+_COLUMN_LIMITS = MappingProxyType({fileType: MappingProxyType({col: dbtype.length for col, dbtype in dbtypes.items() if isinstance(dbtype, sa.types.String)})
+                                   for fileType, dbtypes in _DB_TYPES.items()})
+
+_COLUMNS_ORDER = MappingProxyType({
+    "ValidationOk": ("BankName", "AccountNumber", "ShebaNumber", "NationalCode", "Date", "TransactionTime", "Status", "FileBatchId"),
+    "ValidationError": ("BankName", "AccountNumber", "ShebaNumber", "NationalCode", "Date", "TransactionTime", "ErrorCode", "Status", "FileBatchId")})
+
+_TABLES = MappingProxyType({fileType: sa.Table(fileType, _METADATA, *[sa.Column(col, dbtypes[col]) for col in _COLUMNS_ORDER[fileType]],
+                                               sa.ForeignKeyConstraint(['FileBatchId'], ['Account.FileBatch.FileBatchId']))
+                            for fileType, dbtypes in _DB_TYPES.items()})
 
 def extractWantedFiles(path):
-    files = os.listdir(path)
-    result = [re.findall(string = file, pattern = 'ValidationError\d*.txt|ValidationOk\d*.txt')[0] for file in files ]  
+    result = {}
+    with os.scandir(path) as entries:
+        for entry in sorted(entries, key = lambda entry: entry.name):
+            match = _FILE_RE.fullmatch(entry.name)
+            if match and entry.is_file():
+                result[entry.name] = match.group(1)
     return result
 
-def detectFileType(file):
-    pattern = '(ValidationError|ValidationOk)\d*\.txt'
-    return re.findall(pattern, file)[0]
-
-def readErroneusLines(filePath):
-    with codecs.open(filePath, 'r', 'UTF-8') as file:
-        lines = file.readlines()
-    lines = [re.findall(string = line, pattern = ".*{.*")[0].replace('\t\r', '') for line in lines if re.findall(string = line, pattern = "{")]
-    linesSplitted = [line.split('\t') for line in lines]
+def correctErroneusLines(lines, columnCount):
     linesCorrected = []
-    for line in linesSplitted:
-        if(len(line) == 10):
-            linesCorrected.append(line[0:6] + [line[6] + line[7] + line[8] + line[9]])
-        elif(len(line) == 7):
+    for line in lines:
+        line = line.removesuffix('\t').split('\t')
+        if(len(line) == columnCount + 3):
+            linesCorrected.append(line[0:columnCount - 1] + [''.join(line[columnCount - 1:])])
+        elif(len(line) == columnCount):
             linesCorrected.append(line)
-    return linesCorrected 
+    return linesCorrected
 
-def renameCols(df, fileType):
+def getColumnNames(fileType):
     if fileType == "ValidationOk":
-        df.columns = ["BankName", "AccountNumber", "ShebaNumber", "NationalCode", "TransactionTime", "Status"]
+        return ["BankName", "AccountNumber", "ShebaNumber", "NationalCode", "TransactionTime", "Status"]
     elif fileType == "ValidationError":
-        df.columns = ["BankName", "AccountNumber", "ShebaNumber", "NationalCode", "TransactionTime", "ErrorCode", "Status"]
-    return df
-
-def loadTextFiles(fileName, path, fileType):
-    filePath = '/'.join([path, fileName])
-    df = pd.read_csv(filepath_or_buffer=filePath, delimiter='\t', header=None, on_bad_lines='skip',  engine='python').dropna(axis = 1, how = "all")
-    df = renameCols(df, fileType)
-    if fileType == "ValidationError":
-        linesCorrected = readErroneusLines(filePath)
-        dfCorrctedLines = pd.DataFrame(linesCorrected)
-        dfCorrctedLines = renameCols(dfCorrctedLines, fileType)
-        completeDF = pd.concat([df, dfCorrctedLines])
-        return completeDF
-    else: 
-        return df
+        return ["BankName", "AccountNumber", "ShebaNumber", "NationalCode", "TransactionTime", "ErrorCode", "Status"]
+
+def readBlocks(filePath, blockSize):
+    with open(filePath, 'rb') as file:
+        while block := file.read(blockSize):
+            end = block.rfind(b'\n') + 1
+            while end == 0 and (more := file.read(blockSize)):
+                block += more
+                end = block.rfind(b'\n') + 1
+            if 0 < end < len(block):
+                file.seek(end - len(block), os.SEEK_CUR)
+                block = memoryview(block)[:end]
+            yield block
+
+def loadTextFiles(fileName, path, fileType, blockSize = 64 << 20):
+    filePath = Path(path, fileName)
+    columnNames = getColumnNames(fileType)
+    fieldNames = ['f' + str(i) for i in range(len(columnNames))]
+    erroneusLines = []
+    def handleInvalidRow(row):
+        if row.actual_columns == len(columnNames) or (fileType == "ValidationError" and '{' in row.text):
+            erroneusLines.append(row.text)
+        return 'skip'
+    for block in readBlocks(filePath, blockSize):
+        reader = pacsv.open_csv(pa.BufferReader(block),
+                                read_options = pacsv.ReadOptions(column_names = fieldNames + ['trailing'], block_size = len(block)),
+                                parse_options = pacsv.ParseOptions(delimiter = '\t', invalid_row_handler = handleInvalidRow),
+                                convert_options = pacsv.ConvertOptions(include_columns = fieldNames, column_types = dict.fromkeys(fieldNames, pa.string())))
+        with reader:
+            for batch in reader:
+                yield batch.to_pandas(types_mapper = {pa.string(): pd.StringDtype('pyarrow')}.get).set_axis(columnNames, axis = 1)
+        if erroneusLines:
+            recovered = pd.DataFrame(correctErroneusLines(erroneusLines, len(columnNames)), columns=columnNames, dtype='string[pyarrow]')
+            erroneusLines.clear()
+            yield recovered
     
         
 def makeDataClean(data, fileType):
-    for col in range(data.shape[1]):
-        data.iloc[:, col] = data.iloc[:, col].str.replace('^.*?:','', regex = True).str.strip()
+    for col in data.columns:
+        column = data[col]
+        if not isinstance(column.dtype, pd.StringDtype):
+            column = column.astype('string[pyarrow]')
+        data[col] = column.str.replace('^[^:]*:', '', n = 1, regex = True).str.strip()
     return data
         
-def enrichData(data, file, fileType):
-    data['Date'] = data.TransactionTime.str[:10]
-    data['FileName'] = file
-    data['Type'] = fileType
-    if fileType == "ValidationOk":
-        columnsOrder = ["BankName", "AccountNumber", "ShebaNumber", "NationalCode", "Date", "TransactionTime", "Status", 'FileName', 'Type']
-    elif fileType == "ValidationError":
-        columnsOrder = ["BankName", "AccountNumber", "ShebaNumber", "NationalCode", "Date", "TransactionTime", "ErrorCode", "Status", 'FileName', 'Type']
-    return data[columnsOrder]
+def enrichData(data, fileBatchId, fileType):
+    return data.assign(Date = data['TransactionTime'].str.slice(0, 10), FileBatchId = fileBatchId).reindex(columns = _COLUMNS_ORDER[fileType])
     
-def createPickle(data, fileType):
-    if fileType == "ValidationOk":
-        data.to_pickle('Pickles/ValidationOk.pickle')
-    elif fileType == "ValidationError":
-        data.to_pickle('Pickles/ValidationError.pickle')
+def processFile(file, fileType, path, blockSize = 64 << 20, chunkSize = 10000, backup = True):
+    dbtypes = setDBTypes(fileType)
+    engine = createEngine()
+    fileBatchId = None
+    rowCount = 0
+    writer = None
+    try:
+        with engine.begin() as connection:
+            for data in loadTextFiles(file, path, fileType, blockSize):
+                if data.shape[0] == 0:
+                    continue
+                if fileBatchId is None:
+                    fileBatchId = createFileBatch(connection, file, fileType)
+                data = makeDataClean(data, fileType)
+                data = enrichData(data, fileBatchId, fileType)
+                if backup:
+                    if writer is None:
+                        writer = openBackup(data, file)
+                    writeBackup(writer, data)
+                insertData(fixColumnSize(data, fileType), fileType, connection, dbtypes, chunkSize = chunkSize)
+                rowCount += data.shape[0]
+    finally:
+        if writer is not None:
+            writer.close()
+    return rowCount
+
+def initWorker():
+    pa.set_cpu_count(1)
+    createEngine().connect().close()
+
+def openBackup(data, file):
+    schema = pa.Schema.from_pandas(data, preserve_index=False)
+    return pa.ipc.new_file(Path('Pickles', file).with_suffix('.feather'), schema, options=pa.ipc.IpcWriteOptions(compression='lz4'))
+
+def writeBackup(writer, data):
+    writer.write_table(pa.Table.from_pandas(data, preserve_index=False))
 
 def moveLogs(path, files):
-    folderName = datetime.strftime(datetime.now(), '%Y-%m-%d %H%M')
-    os.makedirs('/'.join([path, folderName]))
+    path = Path(path)
+    folderPath = path / datetime.now().strftime('%Y-%m-%d %H%M')
+    folderPath.mkdir(exist_ok = True)
     for file in files:
-        shutil.move('/'.join([path, file]), '/'.join([path, folderName, file]))
+        try:
+            os.replace(path / file, folderPath / file)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            shutil.move(path / file, folderPath / file)
     
 def createEngine():
-    config = 'mssql+pyodbc://172.16.1.121/SadeghiTest?driver=SQL+Server+Native+Client+11.0'
-    return sa.create_engine(config)
+    global _engine
+    if _engine is None:
+        config = 'mssql+pyodbc://172.16.1.121/SadeghiTest?driver=SQL+Server+Native+Client+11.0'
+        _engine = sa.create_engine(config, fast_executemany=True)
+    return _engine
+
+def createTables(engine):
+    _METADATA.create_all(engine, checkfirst = True)
+    inspector = sa.inspect(engine)
+    for tableName in _TABLES:
+        if 'FileBatchId' not in {col['name'] for col in inspector.get_columns(tableName, schema = _METADATA.schema)}:
+            raise RuntimeError(f'{_METADATA.schema}.{tableName} has no FileBatchId column, run MigrateFileBatch.py first')
+
+def createFileBatch(connection, file, fileType):
+    query = _FILE_BATCH.insert().returning(_FILE_BATCH.c.FileBatchId)
+    return connection.execute(query, {"FileName": file, "Type": fileType, "ProcessedAt": datetime.now()}).scalar_one()
+
+def getInputSize(dbtype):
+    import pyodbc
+    if isinstance(dbtype, sa.types.NVARCHAR):
+        return (pyodbc.SQL_WVARCHAR, dbtype.length, 0)
+    elif isinstance(dbtype, sa.types.VARCHAR):
+        return (pyodbc.SQL_VARCHAR, dbtype.length, 0)
+    elif isinstance(dbtype, sa.types.INTEGER):
+        return (pyodbc.SQL_INTEGER, 0, 0)
+
+def insertData(data, tableName, connection, dbtypes, schema = 'Account', chunkSize = 10000):
+    columns = ', '.join('[' + col + ']' for col in data.columns)
+    placeholders = ', '.join(['?'] * data.shape[1])
+    query = f'INSERT INTO [{schema}].[{tableName}] ({columns}) VALUES ({placeholders})'
+    cursor = connection.connection.cursor()
+    try:
+        cursor.fast_executemany = True
+        cursor.setinputsizes([getInputSize(dbtypes[col]) for col in data.columns])
+        for start in range(0, data.shape[0], chunkSize):
+            chunk = data.iloc[start:start + chunkSize]
+            cursor.executemany(query, list(chunk.astype(object).where(chunk.notna(), None).itertuples(index = False, name = None)))
+    finally:
+        cursor.close()
 
 def setDBTypes(fileType):
-    if fileType == "ValidationOk":
-        dtype = {"BankName":  sa.types.NVARCHAR(length=50), 
-                 "AccountNumber": sa.types.VARCHAR(length=50), 
-                 "ShebaNumber": sa.types.VARCHAR(length=50),
-                 "NationalCode": sa.types.VARCHAR(length=30), 
-                 "Date": sa.types.VARCHAR(length=10), 
-                 "TransactionTime": sa.types.VARCHAR(length=21),  
-                 "Status": sa.types.NVARCHAR(length=1000), 
-                 "FileName": sa.types.NVARCHAR(length=50), 
-                 "Type": sa.types.VARCHAR(length=20)}
-    elif fileType == "ValidationError":
-        dtype = {"BankName":  sa.types.NVARCHAR(length=100), 
-                 "AccountNumber": sa.types.VARCHAR(length=50), 
-                 "ShebaNumber": sa.types.VARCHAR(length=50),
-                 "NationalCode": sa.types.VARCHAR(length=30), 
-                 "Date": sa.types.VARCHAR(length=10), 
-                 "TransactionTime": sa.types.VARCHAR(length=21), 
-                 "ErrorCode": sa.types.VARCHAR(length=10), 
-                 "Status": sa.types.NVARCHAR(length=1000), 
-                 "FileName": sa.types.NVARCHAR(length=50), 
-                 "Type": sa.types.VARCHAR(length=20)}
-    return dtype
+    return _DB_TYPES[fileType]
 
 def fixColumnSize(data, fileType):
-    if fileType == "ValidationOk":
-        data.BankName = data.BankName.str[:50]
-        data.AccountNumber = data.AccountNumber.str[:50]
-        data.ShebaNumber = data.ShebaNumber.str[:50]
-        data.NationalCode = data.NationalCode.str[:50]
-        data.Date = data.Date.str[:50]
-        data.TransactionTime = data.TransactionTime.str[:50]
-        data.Status = data.Status.str[:1000]
-        data.FileName = data.FileName.str[:50]
-        data.Type = data.Type.str[:50]
-    elif fileType == "ValidationError":
-        data.BankName = data.BankName.str[:100]
-        data.AccountNumber = data.AccountNumber.str[:50]
-        data.ShebaNumber = data.ShebaNumber.str[:50]
-        data.NationalCode = data.NationalCode.str[:50]
-        data.Date = data.Date.str[:50]
-        data.TransactionTime = data.TransactionTime.str[:50]
-        data.ErrorCode = data.ErrorCode.str[:50]
-        data.Status = data.Status.str[:1000]
-        data.FileName = data.FileName.str[:50]
-        data.Type = data.Type.str[:50]
+    for col, limit in _COLUMN_LIMITS[fileType].items():
+        if (data[col].str.len() > limit).any():
+            data[col] = data[col].str.slice(stop = limit)
     return data
\ No newline at end of file
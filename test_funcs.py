@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the file loading and cleaning functions in funcs.
+"""
+import tempfile
+import unittest
+from unittest import mock
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+from funcs import extractWantedFiles, correctErroneusLines, loadTextFiles, makeDataClean, moveLogs, fixColumnSize
+
+def writeLog(path, fileName, lines):
+    Path(path, fileName).write_bytes(''.join(line + '\r\n' for line in lines).encode('utf-8'))
+
+def loadAll(path, fileName, fileType):
+    return pd.concat(list(loadTextFiles(fileName, path, fileType)), ignore_index = True)
+
+class LoadTextFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.TemporaryDirectory()
+        self.path = self.tempDir.name
+
+    def tearDown(self):
+        self.tempDir.cleanup()
+
+    def testLeadingSplitStatusRowDoesNotDecideSchema(self):
+        writeLog(self.path, 'ValidationError1.txt',
+                 ['BankName: B9\tAccountNumber: 9\tShebaNumber: IR9\tNationalCode: 9\tTransactionTime: 2023/02/10 11:00:00\tErrorCode: E9\tStatus:{"a":1,\t"b":2,\t"c":3,\t"d":4}\t',
+                  'BankName: B0\tAccountNumber: 200\tShebaNumber: IR0\tNationalCode: 000\tTransactionTime: 2023/02/10 11:00:01\tErrorCode: E0\tStatus: failed\t'])
+        data = loadAll(self.path, 'ValidationError1.txt', 'ValidationError').sort_values('BankName', ignore_index = True)
+        self.assertEqual(data['BankName'].tolist(), ['BankName: B0', 'BankName: B9'])
+        self.assertEqual(data['Status'].tolist(), ['Status: failed', 'Status:{"a":1,"b":2,"c":3,"d":4}'])
+
+    def testRowWithoutTrailingTabIsKept(self):
+        writeLog(self.path, 'ValidationOk1.txt',
+                 ['BankName: B0\tAccountNumber: 1\tShebaNumber: IR0\tNationalCode: 0\tTransactionTime: 2023/02/10 11:00:00\tStatus: ok\t',
+                  'BankName: B1\tAccountNumber: 2\tShebaNumber: IR1\tNationalCode: 1\tTransactionTime: 2023/02/10 11:00:01\tStatus: ok'])
+        data = loadAll(self.path, 'ValidationOk1.txt', 'ValidationOk').sort_values('BankName', ignore_index = True)
+        self.assertEqual(data['BankName'].tolist(), ['BankName: B0', 'BankName: B1'])
+        self.assertEqual(data['Status'].tolist(), ['Status: ok', 'Status: ok'])
+
+    def testShortErrorRowWithoutBraceIsKept(self):
+        writeLog(self.path, 'ValidationError1.txt',
+                 ['BankName: B0\tAccountNumber: 200\tShebaNumber: IR0\tNationalCode: 000\tTransactionTime: 2023/02/10 11:00:00\tErrorCode: E0\tStatus: failed\t',
+                  'BankName: B1\tAccountNumber: 201\tShebaNumber: IR1\tNationalCode: 001\tTransactionTime: 2023/02/10 11:00:01\tErrorCode: E1\tStatus: failed'])
+        data = loadAll(self.path, 'ValidationError1.txt', 'ValidationError').sort_values('BankName', ignore_index = True)
+        self.assertEqual(data['ErrorCode'].tolist(), ['ErrorCode: E0', 'ErrorCode: E1'])
+
+    def testRecoveredRowsAreYieldedPerBlock(self):
+        writeLog(self.path, 'ValidationOk1.txt',
+                 ['BankName: B{0}\tAccountNumber: {0}\tShebaNumber: IR{0}\tNationalCode: {0}\tTransactionTime: 2023/02/10 11:00:00\tStatus: ok'.format(i) for i in range(200)])
+        batches = list(loadTextFiles('ValidationOk1.txt', self.path, 'ValidationOk', blockSize = 1024))
+        self.assertEqual(sum(batch.shape[0] for batch in batches), 200)
+        self.assertLess(max(batch.shape[0] for batch in batches), 200)
+
+class CorrectErroneusLinesTest(unittest.TestCase):
+    def testSplitStatusIsMerged(self):
+        lines = ['B\tA\tS\tN\tT\tE\tStatus:{"a":1,\t"b":2,\t"c":3,\t"d":4}\t']
+        self.assertEqual(correctErroneusLines(lines, 7), [['B', 'A', 'S', 'N', 'T', 'E', 'Status:{"a":1,"b":2,"c":3,"d":4}']])
+
+    def testMergeFollowsColumnCount(self):
+        lines = ['B\tA\tS\tN\tT\tStatus:{"a":1,\t"b":2,\t"c":3,\t"d":4}']
+        self.assertEqual(correctErroneusLines(lines, 6), [['B', 'A', 'S', 'N', 'T', 'Status:{"a":1,"b":2,"c":3,"d":4}']])
+
+    def testOtherLengthsAreDropped(self):
+        lines = ['B\tA\tS\tN\tT\tE\tStatus\t', 'B\tA\tS\t', 'B\tA\tS\tN\tT\tE\tS1\tS2\t', 'B\tA\tS\tN\tT\tE\tS1\tS2\tS3\tS4\tS5\t']
+        self.assertEqual(correctErroneusLines(lines, 7), [['B', 'A', 'S', 'N', 'T', 'E', 'Status']])
+
+class MakeDataCleanTest(unittest.TestCase):
+    def testOnlyTheLabelIsStripped(self):
+        data = pd.DataFrame({"BankName": ['BankName: B0 ', 'BankName:B1'],
+                             "TransactionTime": ['TransactionTime: 2023/02/10 11:00:00', 'TransactionTime: 2023/02/11 12:30:45'],
+                             "Status": ['Status: failed: code:7', ' no label ']}, dtype = 'string[pyarrow]')
+        data = makeDataClean(data, "ValidationOk")
+        self.assertEqual(data['BankName'].tolist(), ['B0', 'B1'])
+        self.assertEqual(data['TransactionTime'].tolist(), ['2023/02/10 11:00:00', '2023/02/11 12:30:45'])
+        self.assertEqual(data['Status'].tolist(), ['failed: code:7', 'no label'])
+
+    def testNonStringColumnsAreConverted(self):
+        data = makeDataClean(pd.DataFrame({"BankName": ['BankName: B0', None]}, dtype = object), "ValidationOk")
+        self.assertIsInstance(data['BankName'].dtype, pd.StringDtype)
+        self.assertEqual(data['BankName'].iloc[0], 'B0')
+        self.assertTrue(pd.isna(data['BankName'].iloc[1]))
+
+class FixColumnSizeTest(unittest.TestCase):
+    def testValuesAreCutToTheDatabaseLengths(self):
+        limits = {"BankName": 100, "AccountNumber": 50, "ShebaNumber": 50, "NationalCode": 30, "Date": 10,
+                  "TransactionTime": 21, "ErrorCode": 10, "Status": 1000}
+        data = pd.DataFrame({col: ['x' * (limit + 5), 'y'] for col, limit in limits.items()}, dtype = 'string[pyarrow]')
+        data['FileBatchId'] = [1, 2]
+        data = fixColumnSize(data, "ValidationError")
+        for col, limit in limits.items():
+            self.assertEqual(data[col].str.len().tolist(), [limit, 1], col)
+        self.assertEqual(data['FileBatchId'].tolist(), [1, 2])
+
+class ExtractWantedFilesTest(unittest.TestCase):
+    def testOnlyMatchingFilesAreReturned(self):
+        with tempfile.TemporaryDirectory() as path:
+            for name in ['ValidationOk1.txt', 'ValidationError.txt', 'ValidationOk2.txt.bak', 'other.csv', 'ValidationOkX.txt']:
+                Path(path, name).touch()
+            Path(path, 'ValidationError3.txt').mkdir()
+            self.assertEqual(extractWantedFiles(path), {'ValidationError.txt': 'ValidationError', 'ValidationOk1.txt': 'ValidationOk'})
+
+class MoveLogsTest(unittest.TestCase):
+    def testSecondRunInTheSameMinuteReusesTheFolder(self):
+        with tempfile.TemporaryDirectory() as path, mock.patch('funcs.datetime') as clock:
+            clock.now.return_value = datetime(2023, 1, 10, 10, 27)
+            Path(path, 'ValidationOk1.txt').touch()
+            Path(path, 'ValidationOk2.txt').touch()
+            moveLogs(path, ['ValidationOk1.txt'])
+            moveLogs(path, ['ValidationOk2.txt'])
+            folderPath = Path(path, '2023-01-10 1027')
+            self.assertEqual(sorted(file.name for file in folderPath.iterdir()), ['ValidationOk1.txt', 'ValidationOk2.txt'])
+            self.assertEqual(sorted(file.name for file in Path(path).iterdir()), ['2023-01-10 1027'])
+
+if __name__ == '__main__':
+    unittest.main()